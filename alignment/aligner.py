@@ -1,6 +1,316 @@
 import numpy as np
-import pandas as pd
 import argparse
+import sys
+from numba import njit, prange
+
+
+@njit(cache=True)
+def _border(s, sub, dash, gap):
+    """
+    Первый столбец (или первая строка) матрицы глобального выравнивания для добавленных спереди пропусков
+    Args:
+        s (np.array): последовательность, закодированная индексами алфавита
+        sub (np.array): матрица весов в индексах алфавита
+        dash (int): индекс пропуска в алфавите
+        gap (int): вес пропуска
+    Returns:
+        np.array: первый столбец (строка) матрицы
+    """
+
+    # вес сочетания пропуска и символа, спереди - пропуск; считаем в int64, чтобы сумма не переполнилась
+    weights = np.empty(s.shape[0] + 1, dtype=np.int64)
+    weights[0] = sub[dash, dash]
+    weights[1:] = sub[dash, s]
+
+    # в клетке сумма весов до неё включительно и по gap за каждый шаг
+    return np.cumsum(weights) + gap * np.arange(weights.shape[0])
+
+
+@njit(cache=True)
+def _score_tables(sub, dash, gap, match, mismatch):
+    """
+    Веса для диагонали и пропусков на каждый символ алфавита, чтобы не считать их заново в каждой клетке
+    Args:
+        sub (np.array): матрица весов в индексах алфавита
+        dash (int): индекс пропуска в алфавите
+        gap (int): вес пропуска
+        match (int): вес совпадения
+        mismatch (int): вес несовпадения
+    Returns:
+        np.array: веса по диагонали для пары символов
+        np.array: веса пропуска во второй последовательности для символа первой
+        np.array: веса пропуска в первой последовательности для символа второй
+    """
+    k = sub.shape[0]
+    pair = np.empty((k, k), dtype=sub.dtype)
+    for x in range(k):
+        for y in range(k):
+            pair[x, y] = sub[x, y] + (match if x == y else mismatch)
+    gap_up = sub[:, dash] + gap
+    gap_left = sub[dash, :] + gap
+    return pair, gap_up, gap_left
+
+
+@njit(cache=True, inline='always')
+def _row(a, s2, prev, curr, pair, gap_up, gap_left, gap, match, mismatch, local, weighted):
+    """
+    Заполнение строки матрицы по предыдущей строке. Функция встраивается в вызывающее ядро, поэтому
+    local и weighted там - константы, и лишние ветки выкидываются
+    Args:
+        a (int): код символа первой последовательности для этой строки
+        s2 (np.array): последовательность 2, закодированная индексами алфавита
+        prev (np.array): предыдущая строка
+        curr (np.array): заполняемая строка, curr[0] уже заполнен
+        pair, gap_up, gap_left (np.array): веса из _score_tables
+        gap (int): вес пропуска
+        match (int): вес совпадения
+        mismatch (int): вес несовпадения
+        local (bool): локальное ли выравнивание
+        weighted (bool): есть ли матрица весов
+    Returns:
+        int: максимум в строке (считается только для локального выравнивания)
+    """
+    top = 0
+    for j in range(1, s2.shape[0] + 1):
+        b = s2[j - 1]
+
+        # по диагонали - совпадение или несовпадение, по вертикали и горизонтали - пропуск;
+        # без ветвлений по символам, чтобы не промахиваться предсказателем переходов на случайных данных
+        if weighted:
+            diag = prev[j - 1] + pair[a, b]
+            up = prev[j] + gap_up[a]
+            left = curr[j - 1] + gap_left[b]
+        else:
+            eq = np.int32(a == b)
+            diag = prev[j - 1] + mismatch + (match - mismatch) * eq
+            up = prev[j] + gap
+            left = curr[j - 1] + gap
+
+        # максимум через тернарные операторы, они превращаются в cmov
+        best = diag if diag > up else up
+        best = best if best > left else left
+
+        if local:
+            best = best if best > 0 else 0
+            top = best if best > top else top
+
+        curr[j] = best
+    return top
+
+
+@njit(cache=True, inline='always')
+def _score_rows(s1, s2, sub, dash, gap, match, mismatch, column, first_row, local, weighted):
+    """
+    Подсчёт итогового веса по двум строкам матрицы; встраивается в ядра так же, как _row
+    Args:
+        s1 (np.array): последовательность 1, закодированная индексами алфавита
+        s2 (np.array): последовательность 2, закодированная индексами алфавита
+        sub (np.array): матрица весов в индексах алфавита
+        dash (int): индекс пропуска в алфавите
+        gap (int): вес пропуска
+        match (int): вес совпадения
+        mismatch (int): вес несовпадения
+        column (np.array): первый столбец матрицы
+        first_row (np.array): первая строка матрицы
+        local (bool): локальное ли выравнивание
+        weighted (bool): есть ли матрица весов
+    Returns:
+        int: итоговый вес выравнивания
+    """
+    pair, gap_up, gap_left = _score_tables(sub, dash, gap, match, mismatch)
+
+    prev = first_row.copy()
+    curr = np.empty_like(prev)
+
+    top = 0
+    for i in range(1, s1.shape[0] + 1):
+        curr[0] = column[i]
+        top = max(top, _row(s1[i - 1], s2, prev, curr, pair, gap_up, gap_left, gap, match, mismatch, local, weighted))
+        prev, curr = curr, prev
+
+    if local:
+        return top
+    return prev[-1]
+
+
+def _make_kernels(local, weighted):
+    """
+    Создание ядер для алгоритма Нидлмана-Вунша (или Смита-Уотермана для локального выравнивания).
+    local и weighted попадают в ядра как константы, поэтому лишние ветки выкидываются при компиляции
+    Args:
+        local (bool): локальное ли выравнивание
+        weighted (bool): есть ли матрица весов
+    Returns:
+        function: заполнение всей матрицы
+        function: подсчёт только итогового веса по двум строкам
+        function: подсчёт итоговых весов для многих пар параллельно
+    """
+
+    @njit(cache=True)
+    def fill(s1, s2, sub, dash, gap, match, mismatch, H):
+        """
+        Заполнение матрицы
+        Args:
+            s1 (np.array): последовательность 1, закодированная индексами алфавита
+            s2 (np.array): последовательность 2, закодированная индексами алфавита
+            sub (np.array): матрица весов в индексах алфавита
+            dash (int): индекс пропуска в алфавите
+            gap (int): вес пропуска
+            match (int): вес совпадения
+            mismatch (int): вес несовпадения
+            H (np.array): матрица с уже заполненными первой строкой и первым столбцом
+        Returns:
+            int: итоговый вес выравнивания
+        """
+        pair, gap_up, gap_left = _score_tables(sub, dash, gap, match, mismatch)
+
+        top = 0
+        for i in range(1, s1.shape[0] + 1):
+            top = max(top, _row(s1[i - 1], s2, H[i - 1], H[i], pair, gap_up, gap_left, gap, match, mismatch,
+                                local, weighted))
+
+        if local:
+            return top
+        return H[-1, -1]
+
+    @njit(cache=True)
+    def score(s1, s2, sub, dash, gap, match, mismatch, column, first_row):
+        """
+        Подсчёт итогового веса без сохранения матрицы: храним только две строки
+        Args:
+            s1 (np.array): последовательность 1, закодированная индексами алфавита
+            s2 (np.array): последовательность 2, закодированная индексами алфавита
+            sub (np.array): матрица весов в индексах алфавита
+            dash (int): индекс пропуска в алфавите
+            gap (int): вес пропуска
+            match (int): вес совпадения
+            mismatch (int): вес несовпадения
+            column (np.array): первый столбец матрицы
+            first_row (np.array): первая строка матрицы
+        Returns:
+            int: итоговый вес выравнивания
+        """
+        return _score_rows(s1, s2, sub, dash, gap, match, mismatch, column, first_row, local, weighted)
+
+    @njit(cache=True, parallel=True)
+    def batch(seqs1, seqs2, offsets1, offsets2, sub, dash, gap, match, mismatch, scores):
+        """
+        Подсчёт итоговых весов для многих пар; пары независимы, поэтому раскидываются по потокам
+        Args:
+            seqs1 (np.array): первые последовательности пар, склеенные и закодированные индексами алфавита
+            seqs2 (np.array): вторые последовательности пар, склеенные и закодированные индексами алфавита
+            offsets1 (np.array): границы первых последовательностей в seqs1, пара k - [offsets1[k], offsets1[k + 1])
+            offsets2 (np.array): границы вторых последовательностей в seqs2
+            sub (np.array): матрица весов в индексах алфавита
+            dash (int): индекс пропуска в алфавите
+            gap (int): вес пропуска
+            match (int): вес совпадения
+            mismatch (int): вес несовпадения
+            scores (np.array): сюда записываются итоговые веса
+        """
+        for k in prange(scores.shape[0]):
+            s1 = seqs1[offsets1[k]:offsets1[k + 1]]
+            s2 = seqs2[offsets2[k]:offsets2[k + 1]]
+
+            if local:
+                column = np.zeros(s1.shape[0] + 1, dtype=np.int64)
+                first_row = np.zeros(s2.shape[0] + 1, dtype=np.int64)
+            else:
+                column = _border(s1, sub, dash, gap)
+                first_row = _border(s2, sub, dash, gap)
+
+            scores[k] = _score_rows(s1, s2, sub, dash, gap, match, mismatch, column, first_row, local, weighted)
+
+    return fill, score, batch
+
+
+@njit(cache=True)
+def _traceback(H, s1, s2, sub, codes, dash, gap, match, mismatch, i, j, local):
+    """
+    Восстановление выравнивания по заполненной матрице
+    Args:
+        H (np.array): заполненная матрица
+        s1 (np.array): последовательность 1, закодированная индексами алфавита
+        s2 (np.array): последовательность 2, закодированная индексами алфавита
+        sub (np.array): матрица весов в индексах алфавита
+        codes (np.array): коды символов алфавита (номера в Unicode)
+        dash (int): индекс пропуска в алфавите
+        gap (int): вес пропуска
+        match (int): вес совпадения
+        mismatch (int): вес несовпадения
+        i (int): индекс начальной клетки по оси 0
+        j (int): индекс начальной клетки по оси 1
+        local (bool): локальное ли выравнивание; для него идём до нуля, для глобального - до левого верхнего края
+    Returns:
+        np.array: коды символов первой последовательности в выравнивании, выравнивание лежит в конце буфера
+        np.array: коды символов второй последовательности в выравнивании, выравнивание лежит в конце буфера
+        int: индекс начала выравнивания в буферах
+    """
+
+    # идём с конца выравнивания, поэтому и буферы заполняем с конца - разворачивать потом не придётся
+    k = i + j + 1
+    aln1 = np.empty(k, dtype=np.uint32)
+    aln2 = np.empty(k, dtype=np.uint32)
+
+    value = H[i, j]
+    while (value != 0) if local else (i >= 1 or j >= 1):
+
+        # значение в текущей клетке и символы, которые сейчас сравниваем
+        value = H[i, j]
+        a = s1[i - 1] if i >= 1 else dash
+        b = s2[j - 1] if j >= 1 else dash
+
+        # место под очередную пару символов
+        k -= 1
+
+        # если символы совпадают и мы пришли из клетки по диагонали или символы по диагонали не совпали
+        if i >= 1 and j >= 1 and ((value - H[i - 1, j - 1] == match + sub[a, b] and a == b) or
+                                  value - H[i - 1, j - 1] == mismatch + sub[a, b]):
+            aln1[k], aln2[k] = codes[a], codes[b]
+            i, j = i - 1, j - 1
+
+        # если идём налево, то пропуск и символ второй последовательности
+        elif j >= 1 and value - H[i, j - 1] == gap + sub[dash, b]:
+            aln1[k], aln2[k] = codes[dash], codes[b]
+            j -= 1
+
+        # если идём наверх, то символ первой последовательности и пропуск
+        elif i >= 1 and value - H[i - 1, j] == gap + sub[a, dash]:
+            aln1[k], aln2[k] = codes[a], codes[dash]
+            i -= 1
+
+        # идти некуда
+        else:
+            k += 1
+            break
+
+    return aln1, aln2, k
+
+
+_fill_global_nomat, _score_global_nomat, _batch_global_nomat = _make_kernels(local=False, weighted=False)
+_fill_local_nomat, _score_local_nomat, _batch_local_nomat = _make_kernels(local=True, weighted=False)
+_fill_global_mat, _score_global_mat, _batch_global_mat = _make_kernels(local=False, weighted=True)
+_fill_local_mat, _score_local_mat, _batch_local_mat = _make_kernels(local=True, weighted=True)
+
+# ядра по (локальное ли выравнивание, есть ли матрица весов)
+_FILL = {
+    (False, False): _fill_global_nomat,
+    (True, False): _fill_local_nomat,
+    (False, True): _fill_global_mat,
+    (True, True): _fill_local_mat,
+}
+_SCORE = {
+    (False, False): _score_global_nomat,
+    (True, False): _score_local_nomat,
+    (False, True): _score_global_mat,
+    (True, True): _score_local_mat,
+}
+_BATCH = {
+    (False, False): _batch_global_nomat,
+    (True, False): _batch_local_nomat,
+    (False, True): _batch_global_mat,
+    (True, True): _batch_local_mat,
+}
 
 
 class Aligner:
@@ -21,23 +331,85 @@ class Aligner:
         # делаем большими и красивыми
         self.seq1 = seq1.upper()
         self.seq2 = seq2.upper()
-        self.match = np.float32(match)
-        self.gap = np.float32(gap)
-        self.mismatch = np.float32(mismatch)
 
         # используется ли локальное выравнивание
         self.local = local
 
-        # устанавливаем веса
-        self.weights = self.set_weights(weights)
+        # устанавливаем веса: символы алфавита и матрица весов в индексах алфавита
+        self.weighted = bool(weights)
+        self.symbols, sub = self.set_weights(weights)
+
+        # матрица целочисленная, поэтому дробные веса домножаем на степень 10
+        self.scale = self.get_scale(match, gap, mismatch)
+        match, gap, mismatch = (round(w * self.scale) for w in (match, gap, mismatch))
+
+        # тип матрицы выбираем так, чтобы веса в ней не переполнились
+        self.dtype = self.get_dtype(match, gap, mismatch, int(np.abs(sub).max()) * self.scale)
+        self.match = self.dtype(match)
+        self.gap = self.dtype(gap)
+        self.mismatch = self.dtype(mismatch)
+        self.sub = sub.astype(self.dtype) * self.dtype(self.scale)
+
+        # таблица символ -> индекс в алфавите и обратно
+        self.alphabet = self.get_alphabet()
+        self.codes = self.to_codes(''.join(self.symbols))
+        self.dash = self.alphabet[ord('-')]
+
+        # кодируем последовательности индексами алфавита один раз
+        self.s1_enc = self.encode(self.seq1, self.alphabet)
+        self.s2_enc = self.encode(self.seq2, self.alphabet)
+
+        # матрица и итоговый вес появятся после align
+        self.matrix = None
+        self.raw_score = None
+        self.score = None
+
+    @staticmethod
+    def get_scale(*weights, max_scale=10 ** 4):
+        """
+        Получение множителя, после умножения на который все веса становятся целыми
+        Args:
+            weights (float): веса
+            max_scale (int): максимальный множитель
+        Returns:
+            int: степень 10
+        Raises:
+            ValueError: если веса не становятся целыми даже после умножения на max_scale
+        """
 
-        # инициализируем матрицу
-        self.matrix = self.init_matrix()
+        def is_integer(scale):
+            return all(abs(w * scale - round(w * scale)) <= 1e-6 for w in weights)
 
-    def check_non_negativity(self, result):
-        if self.local:
-            return max(0, result)
-        return result
+        scale = 1
+        while scale < max_scale and not is_integer(scale):
+            scale *= 10
+
+        # округлять нельзя - это молча поменяло бы веса, а с ними и выравнивание
+        if not is_integer(scale):
+            raise ValueError(f'Weights {weights} are not integers even after scaling by {max_scale}')
+        return scale
+
+    def get_dtype(self, match, gap, mismatch, max_weight):
+        """
+        Выбор типа матрицы: int32, если вес любого пути в матрице в него помещается, иначе int64
+        Args:
+            match (int): вес совпадения в масштабе матрицы
+            gap (int): вес пропуска в масштабе матрицы
+            mismatch (int): вес несовпадения в масштабе матрицы
+            max_weight (int): максимальный по модулю вес из матрицы весов в масштабе матрицы
+        Returns:
+            type: np.int32 или np.int64
+        """
+
+        # на каждом шаге пути прибавляется не больше одного веса из аргументов и одного из матрицы весов
+        step = max(abs(match), abs(gap), abs(mismatch)) + max_weight
+        bound = (len(self.seq1) + len(self.seq2) + 1) * step
+
+        if bound < np.iinfo(np.int32).max:
+            return np.int32
+        if bound < np.iinfo(np.int64).max:
+            return np.int64
+        raise ValueError(f'Alignment scores do not fit into int64: bound {bound}')
 
     def init_matrix(self):
         """
@@ -47,48 +419,72 @@ class Aligner:
         """
 
         # сначала инициализируем матрицу нулями по размерам посл1 + 1, посл2 + 1; + 1 за пропуск спереди
-        matrix = np.zeros([len(self.seq1) + 1, len(self.seq2) + 1])
-
-        if self.local:
-            return matrix
-
-        # это чтобы выстаскивать веса
-        seq = ['-' + self.seq1, '-' + self.seq2]
+        matrix = np.zeros([len(self.seq1) + 1, len(self.seq2) + 1], dtype=self.dtype)
 
         # заполняем первую строку и первый столбец
-        for i, axis in enumerate(matrix.shape):
-            counter = 0
+        matrix[:, 0], matrix[0, :] = self.init_borders()
 
-            for ax in range(axis):
-                position = (0, ax) if i else (ax, 0)
+        return matrix
 
-                # прибавляем вес сочетания пропуска и символа
-                matrix[position] = counter + self.weights.loc[('-', seq[i][ax])]
+    def init_borders(self):
+        """
+        Заполнение первого столбца и первой строки матрицы для добавленных спереди пропусков
+        Returns:
+            np.array: первый столбец
+            np.array: первая строка
+        """
 
-                # заполнение последовательно += self.gap
-                counter += self.gap + self.weights.loc[('-', seq[i][ax])]
+        # для локального выравнивания края нулевые
+        if self.local:
+            return [np.zeros(len(encoded) + 1, dtype=self.dtype) for encoded in (self.s1_enc, self.s2_enc)]
 
-        return matrix
+        # края считаются в int64, сужать до self.dtype безопасно - границу проверили в get_dtype
+        return [_border(encoded, self.sub, self.dash, self.gap).astype(self.dtype)
+                for encoded in (self.s1_enc, self.s2_enc)]
 
-    def align(self):
+    def align(self, need_traceback=True):
         """
         Получение матрицы по алгоритму Нидлмана-Вунша
+        Args:
+            need_traceback (bool): нужна ли вся матрица (для выравнивания или печати); если нет - считаем только
+                итоговый вес, храня две строки матрицы
         """
 
-        # заполняем каждую клетку
-        for i in range(1, len(self.seq1) + 1):
-            for j in range(1, len(self.seq2) + 1):
-                self.matrix[i, j] = self.check_non_negativity(self.cell(i, j))
+        args = (self.s1_enc, self.s2_enc, self.sub, self.dash, self.gap, self.match, self.mismatch)
+
+        if need_traceback:
+            # заполняем каждую клетку
+            self.matrix = self.init_matrix()
+            score = _FILL[(self.local, self.weighted)](*args, self.matrix)
+        else:
+            score = _SCORE[(self.local, self.weighted)](*args, *self.init_borders())
+
+        # вес в масштабе матрицы (для локального - её максимум) и в исходном масштабе
+        self.raw_score = score
+        self.score = score / self.scale if self.scale != 1 else score
+
+    def check_matrix(self):
+        """
+        Проверка, что матрица уже заполнена: без align(need_traceback=True) её нет
+        """
 
-        # печатаем получившуюся матрицу
-        self.print_matrix()
+        if self.matrix is None:
+            raise RuntimeError('Matrix is not filled, call align() first')
 
     def print_matrix(self):
         """
         Печать матрицы по алгоритму Н-В
         """
 
-        print(pd.DataFrame(data=self.matrix, index=list(' ' + self.seq1), columns=list(' ' + self.seq2)))
+        self.check_matrix()
+
+        # pandas нужен только для красивой печати, поэтому импортируем здесь
+        import pandas as pd
+
+        # возвращаем веса к исходному масштабу
+        matrix = self.matrix / self.scale if self.scale != 1 else self.matrix
+
+        print(pd.DataFrame(data=matrix, index=list(' ' + self.seq1), columns=list(' ' + self.seq2)))
 
     def set_weights(self, weights):
         """
@@ -96,7 +492,8 @@ class Aligner:
         Args:
             weights (str): название матрицы весов, может быть 'pam', 'blosum', а также False - весов нет
         Returns:
-            pd.DataFrame: матрица весов
+            list: символы алфавита
+            np.array: матрица весов в индексах алфавита
         """
 
         if weights:
@@ -104,253 +501,124 @@ class Aligner:
                 filename = 'alignment/PAM250.txt'
             elif weights.lower() == 'blosum':
                 filename = 'alignment/BLOSUM62.txt'
-            return pd.read_csv(filename, delimiter=' ', index_col=0, header=0)
+
+            # в первой строке - алфавит, дальше в каждой строке символ и его веса в том же порядке
+            with open(filename) as file:
+                symbols = file.readline().split()
+            table = np.loadtxt(filename, skiprows=1, usecols=range(1, len(symbols) + 1), dtype=np.int32)
+            return symbols, table
 
         # заполняем веса 0
         else:
-            seq = set(self.seq1 + self.seq2 + '-')
+            seq = sorted(set(self.seq1 + self.seq2 + '-'))
 
-            return pd.DataFrame(np.zeros([len(seq), len(seq)]), index=seq,
-                                columns=seq)
+            return seq, np.zeros([len(seq), len(seq)], dtype=np.int32)
 
-    def cell(self, i, j):
+    def get_alphabet(self):
         """
-        Заполнение клетки матрицы по Н-В
-        Args:
-            i (int): индекс элемента по оси 0
-            j (int): индекс по оси 1
+        Таблица для перевода символов в индексы алфавита
         Returns:
-            float: значение в клетке
+            np.array: таблица код символа -> индекс символа в алфавите (-1, если символа нет)
         """
 
-        # символы, которые выравниваем
-        seq1, seq2 = self.seq1[i - 1], self.seq2[j - 1]
-
-        # получаем троих соседей
-        idx = self.get_neighbours(i, j, make_tuple=True)
-
-        # какие веса потребуются
-        weights = [(seq1, seq2), (seq1, '-'), ('-', seq2)]
+        # таблица покрывает ASCII и все символы алфавита, даже если они за пределами ASCII
+        size = max([128] + [ord(symbol) + 1 for symbol in self.symbols])
+        dtype = np.int8 if len(self.symbols) <= np.iinfo(np.int8).max else np.int16
 
-        # массив, из которого будем выбирать итоговое значение (максимум)
-        available = []
+        alphabet = np.full(size, -1, dtype=dtype)
+        for index, symbol in enumerate(self.symbols):
+            alphabet[ord(symbol)] = index
 
-        # итерируемся по парам индексов соседей и ключей весов
-        for index, weight in zip(idx, weights):
+        return alphabet
 
-            # для удобства запомним индексы соседей по осям отдельно
-            first_index = index[0]
-            second_index = index[1]
-
-            # получаем текущий вес
-            current_weight = self.weights.loc[weight]
-
-            # получаем значение в клетке-соседе
-            current_cell = self.matrix[index]
+    @staticmethod
+    def to_codes(seq):
+        """
+        Коды символов строки
+        Args:
+            seq (str): строка
+        Returns:
+            np.array: номера символов в Unicode
+        """
 
-            # если идём по диагонали
-            if (i - 1 == first_index) & (j - 1 == second_index):
+        return np.frombuffer(seq.encode('utf-32-le'), dtype=np.uint32)
 
-                # если символы совпали, то прибавляем вес совпадения
-                if seq1 == seq2:
-                    current_cell += self.match
+    @staticmethod
+    def encode(seq, alphabet):
+        """
+        Кодирование последовательности индексами алфавита
+        Args:
+            seq (str): последовательность
+            alphabet (np.array): таблица код символа -> индекс символа в алфавите
+        Returns:
+            np.array: закодированная последовательность
+        """
 
-                # иначе - несовпадения
-                else:
-                    current_cell += self.mismatch
+        codes = Aligner.to_codes(seq)
 
-            # если не по диагонали, то это пропуск
-            else:
-                current_cell += self.gap
+        # символы с кодом за пределами таблицы точно не из алфавита
+        encoded = np.full(codes.shape[0], -1, dtype=alphabet.dtype)
+        known = codes < alphabet.shape[0]
+        encoded[known] = alphabet[codes[known]]
 
-            # доавбляем вес
-            current_cell += current_weight
-
-            available.append(current_cell)
-        return max(available)
+        if np.any(encoded < 0):
+            unknown = set(seq) - {chr(code) for code in np.flatnonzero(alphabet >= 0)}
+            raise ValueError(f'Symbols not found in weights: {unknown}')
+        return encoded
 
     def print_alignment(self):
         """
         Красиво печатаем выравнивание
         """
-        for cell in self.alignment:
-            print(f'\nAlignment starts in cell {cell}:')
-            for alignment in self.alignment[cell]:
-                print('\t', *alignment[::-1])
-
-    def get_neighbours(self, i, j, make_tuple=False):
-        """
-        Получаем индексы трёх соседей: слева, сверху и слева сверху по диагонали
-        Args:
-            i (int): индекс элемента по оси 0
-            j (int): индекс элемента по оси 1
-            make_tuple (bool): нужно ли возвращать пары индексов в tuple (сразу для индексации) или в list
-        Returns:
-            list: список пар индексов
-        """
-
-        result = [[i - 1, j - 1], [i, j - 1], [i - 1, j]]
+        lines = []
+        for cell, alignment in self.alignment.items():
+            lines.append(f'\nAlignment starts in cell {cell}:')
+            lines.extend('\t ' + ' '.join(row) for row in alignment)
 
-        # если надо tuple, то делаем map
-        if make_tuple:
-            return list(map(tuple, result))
-        return result
+        # пишем всё одной строкой
+        sys.stdout.write('\n'.join(lines) + '\n')
 
     def select_global_alignment(self):
         """
         Получение выравненных строк
         """
 
-        # результат выравнивания
-        self.alignment = [[], []]
+        self.check_matrix()
 
         # значение, из которого пойдём - правый нижний край
-        current = np.array(self.matrix.shape) - 1
-
-        # конец (не интересует сочетание двух пропусков)
-        end = np.array([1, 1])
-
-        # пока не дошли до конца
-        while np.any(current >= end):
-
-            # запоминааем текущие индексы по осям
-            first_index = current[0]
-            second_index = current[1]
+        end = (self.matrix.shape[0] - 1, self.matrix.shape[1] - 1)
 
-            # получаем троих соседей
-            idx = self.get_neighbours(first_index, second_index)
-
-            # выбираем только неотрицательные, на всякий случай
-            idx = np.array([i for i in idx if ((i[0] >= 0) and (i[1] >= 0))])
-
-            # значение в текущей клетке
-            value = self.matrix[tuple(current)]
-
-            # по каждому соседу
-            for index in idx:
-
-                # символы, которые сейчас сравниваем
-                seq1 = self.seq1[current[0] - 1]
-                seq2 = self.seq2[current[1] - 1]
-
-                # значение в клетке-соседе
-                backtrace = self.matrix[tuple(index)]
-
-                # если идём по диагонали
-                if np.array_equal(index + 1, current):
-
-                    # берём вес от двух символов
-                    weight = self.weights.loc[(seq1, seq2)]
-
-                    # если символы совпадают и мы пришли из клетки по диагонали или символы по диагонали не совпали
-                    if ((value - backtrace == self.match + weight) and (seq1 == seq2)) or \
-                            (value - backtrace == self.mismatch + weight):
-
-                        # добавляем в результат оба символа
-                        self.alignment[0].append(seq1)
-                        self.alignment[1].append(seq2)
-
-                        # переходим в клетку-соседа
-                        current = index
-                        break
-
-                # если идём наверх
-                elif current[0] - index[0]:
-
-                    # берём вес для символа первой последовательности и пропуска
-                    weight = self.weights.loc[(seq1, '-')]
-                    if value - backtrace == self.gap + weight:
-                        self.alignment[0].append(seq1)
-                        self.alignment[1].append('-')
-                        current = index
-                        break
-
-                # если идём налево, то пропуск и символ второй последовательности
-                else:
-                    weight = self.weights.loc[('-', seq2)]
-                    if value - backtrace == self.gap + weight:
-                        self.alignment[0].append('-')
-                        self.alignment[1].append(seq2)
-                        current = index
-                        break
-        self.alignment = {tuple(np.array(self.matrix.shape) - 1): self.alignment}
+        self.alignment = {end: self.traceback(*end, local=False)}
 
     def select_local_alignment(self):
-        matrix_max = self.matrix.max()
-        indices = np.where(self.matrix == matrix_max)
-        indices = [(x, y) for x, y in zip(*indices)]
-
-        self.alignment = {}
-
-        for start in indices:
-            # значение в текущей клетке
-            value = self.matrix[tuple(start)]
-            current = start
-
-            alignment = [[], []]
-
-            while value != 0:
-                # запоминааем текущие индексы по осям
-                first_index = current[0]
-                second_index = current[1]
-
-                # получаем троих соседей
-                idx = self.get_neighbours(first_index, second_index)
-
-                # выбираем только неотрицательные, на всякий случай
-                idx = np.array([i for i in idx if ((i[0] >= 0) and (i[1] >= 0))])
-
-                # значение в текущей клетке
-                value = self.matrix[tuple(current)]
-
-                # по каждому соседу
-                for index in idx:
+        self.check_matrix()
 
-                    # символы, которые сейчас сравниваем
-                    seq1 = self.seq1[current[0] - 1]
-                    seq2 = self.seq2[current[1] - 1]
+        # для локального выравнивания максимум уже посчитан при заполнении матрицы
+        matrix_max = self.raw_score if self.local else self.matrix.max()
+        starts = np.argwhere(self.matrix == matrix_max)
 
-                    # значение в клетке-соседе
-                    backtrace = self.matrix[tuple(index)]
-
-                    # если идём по диагонали
-                    if np.array_equal(index + 1, current):
-
-                        # берём вес от двух символов
-                        weight = self.weights.loc[(seq1, seq2)]
-
-                        # если символы совпадают и мы пришли из клетки по диагонали или символы по диагонали не совпали
-                        if ((value - backtrace == self.match + weight) and (seq1 == seq2)) or \
-                                (value - backtrace == self.mismatch + weight):
-                            # добавляем в результат оба символа
-                            alignment[0].append(seq1)
-                            alignment[1].append(seq2)
-
-                            # переходим в клетку-соседа
-                            current = index
-                            break
+        self.alignment = {}
 
-                    # если идём наверх
-                    elif current[0] - index[0]:
+        for start in starts:
+            i, j = int(start[0]), int(start[1])
+            self.alignment[(i, j)] = self.traceback(i, j, local=True)
 
-                        # берём вес для символа первой последовательности и пропуска
-                        weight = self.weights.loc[(seq1, '-')]
-                        if value - backtrace == self.gap + weight:
-                            alignment[0].append(seq1)
-                            alignment[1].append('-')
-                            current = index
-                            break
+    def traceback(self, i, j, local):
+        """
+        Восстановление выравнивания из клетки
+        Args:
+            i (int): индекс клетки по оси 0
+            j (int): индекс клетки по оси 1
+            local (bool): локальное ли выравнивание
+        Returns:
+            list: две выравненные строки
+        """
 
-                    # если идём налево, то пропуск и символ второй последовательности
-                    else:
-                        weight = self.weights.loc[('-', seq2)]
-                        if value - backtrace == self.gap + weight:
-                            alignment[0].append('-')
-                            alignment[1].append(seq2)
-                            current = index
-                            break
+        aln1, aln2, start = _traceback(self.matrix, self.s1_enc, self.s2_enc, self.sub, self.codes, self.dash,
+                                       self.gap, self.match, self.mismatch, i, j, local)
 
-            self.alignment[tuple(start)] = alignment
+        # в буферах уже коды символов в нужном порядке, переводим в строки один раз
+        return [aln[start:].tobytes().decode('utf-32-le') for aln in (aln1, aln2)]
 
 
 def parse_args(args=None):
@@ -381,11 +649,43 @@ def parse_args(args=None):
                         help="Print alignment")
     parser.add_argument("-local", "--local", required=False, action='store_true', dest='local',
                         help="Make local alignment")
+    parser.add_argument("-print-matrix", "--print-matrix", required=False, action='store_true', dest='print_matrix',
+                        help="Print alignment matrix")
 
     args = parser.parse_args(args)
     return args
 
 
+def run_batch(pairs, match=1, gap=-1, mismatch=-1, weights=False, local=False):
+    """
+    Подсчёт итоговых весов выравнивания сразу для многих пар последовательностей, пары считаются параллельно
+    Args:
+        pairs (list): пары последовательностей (str, str)
+        match (float): вес совпадения
+        gap (float): вес пропуска
+        mismatch (float): вес несовпадения
+        weights (str): название матрицы весов, может быть 'pam', 'blosum', а также False - весов нет
+        local (bool): локальное ли выравнивание
+    Returns:
+        np.array: итоговые веса для каждой пары
+    """
+
+    # Aligner от склеенных последовательностей строит веса и кодирует все пары в два общих буфера
+    aligner = Aligner(''.join(seq1 for seq1, _ in pairs), ''.join(seq2 for _, seq2 in pairs), match=match,
+                      gap=gap, mismatch=mismatch, weights=weights, local=local)
+
+    # границы каждой последовательности в буфере
+    offsets1 = np.cumsum([0] + [len(seq1) for seq1, _ in pairs])
+    offsets2 = np.cumsum([0] + [len(seq2) for _, seq2 in pairs])
+
+    scores = np.empty(len(pairs), dtype=np.int64)
+    _BATCH[(aligner.local, aligner.weighted)](aligner.s1_enc, aligner.s2_enc, offsets1, offsets2, aligner.sub,
+                                              aligner.dash, aligner.gap, aligner.match, aligner.mismatch, scores)
+
+    # возвращаем веса к исходному масштабу
+    return scores / aligner.scale if aligner.scale != 1 else scores
+
+
 def run(args=None):
     """
     Функция парсит аргументы командной строки и передает их в класс Aligner.
@@ -402,8 +702,14 @@ def run(args=None):
     aligner = Aligner(args.seq1, args.seq2, match=args.match, mismatch=args.mismatch, gap=args.gap,
                       weights=args.weights, local=args.local)
 
-    # получаем матрицу
-    aligner.align()
+    # получаем матрицу, а если не нужны ни выравнивание, ни матрица - только итоговый вес
+    aligner.align(need_traceback=args.alignment or args.print_matrix)
+
+    # печатаем получившуюся матрицу, если просили
+    if args.print_matrix:
+        aligner.print_matrix()
+
+    print(f'\nScore: {aligner.score}')
 
     # если надо вывести выравниваение, то выводим
     if args.alignment:
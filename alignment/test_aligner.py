@@ -1,5 +1,7 @@
+import subprocess
+import sys
 import unittest
-from alignment.aligner import Aligner
+from alignment.aligner import Aligner, run_batch
 import numpy as np
 import pandas as pd
 
@@ -20,14 +22,15 @@ class TestAligner(unittest.TestCase):
         aligner.select_global_alignment()
 
         # нулевые веса нужного размера
-        seq = set('-ABCA' + '-BDAAAC')
-        weights = pd.DataFrame(np.zeros([len(seq), len(seq)]), index=seq, columns=seq)
+        seq = sorted(set('-ABCA' + '-BDAAAC'))
+        weights = np.zeros([len(seq), len(seq)])
 
         # матрица с сайта
         matrix = pd.read_csv('alignment/aligner_no_weights_check.csv', delimiter=';', index_col=0, header=None, skiprows=1)
 
         # проверяем, что веса есть и они нулевые
-        self.assertEqual(np.array_equal(aligner.weights, weights.values), True)
+        self.assertEqual(aligner.symbols, seq)
+        self.assertEqual(np.array_equal(aligner.sub, weights), True)
 
         # матрица с сайта совпала с посчитанной
         self.assertEqual(np.array_equal(aligner.matrix, matrix), True)
@@ -60,6 +63,95 @@ class TestAligner(unittest.TestCase):
         aligner.align()
         self.assertEqual(aligner.select_global_alignment(), None)
 
+    def test_readme_alignment(self):
+        """
+        Тест для примеров из README: выравнивания должны совпасть с полученными исходной реализацией
+        """
+        seq1, seq2 = 'GGTTGACTA', 'TGTTACGGTA'
+
+        expected = {
+            # (локальное ли выравнивание, матрица весов): (вес, выравнивания по начальным клеткам)
+            (False, False): (0, {(9, 10): ['GGTTGAC--TA', 'TGTT-ACGGTA']}),
+            (True, False): (3, {(3, 9): ['GGT', 'GGT'], (4, 4): ['GTT', 'GTT'], (7, 6): ['GTTGAC', 'GTT-AC']}),
+            (False, 'pam'): (7, {(9, 10): ['GGTTG-ACTA', 'TGTTACGGTA']}),
+            (True, 'pam'): (20, {(7, 6): ['GTTGAC', 'GTT-AC']}),
+        }
+
+        for (local, weights), (score, alignment) in expected.items():
+            aligner = Aligner(seq1=seq1, seq2=seq2, gap=-2, weights=weights, local=local)
+            aligner.align()
+            if local:
+                aligner.select_local_alignment()
+            else:
+                aligner.select_global_alignment()
+
+            self.assertEqual(aligner.score, score)
+            self.assertEqual(aligner.alignment, alignment)
+
+    def test_non_ascii(self):
+        """
+        Тест для символов не из ASCII: без матрицы весов они просто становятся частью алфавита,
+        а в матрице весов их нет - должна быть понятная ошибка
+        """
+        aligner = Aligner(seq1='ёжик', seq2='ЁЖК', local=True)
+        aligner.align()
+        aligner.select_local_alignment()
+        self.assertEqual(aligner.alignment, {(2, 2): ['ЁЖ', 'ЁЖ'], (4, 3): ['ЁЖИК', 'ЁЖ-К']})
+
+        self.assertRaises(ValueError, Aligner, seq1='ЁA', seq2='A', weights='pam')
+
+    def test_overflow(self):
+        """
+        Тест для длинной последовательности с дробным весом пропуска: веса домножаются на 10^4,
+        в int32 итоговый вес уже не помещается, и матрица должна стать int64
+        """
+        aligner = Aligner(seq1='A' * 30000, seq2='A', weights='pam', gap=-0.0001)
+        self.assertEqual(aligner.dtype, np.int64)
+
+        # путь: вес ('-', '-') в углу, 29999 пропусков во второй последовательности и одно совпадение A-A
+        expected = 1 + 29999 * (-8 - 0.0001) + (2 + 1)
+
+        aligner.align(need_traceback=False)
+        self.assertAlmostEqual(aligner.score, expected)
+
+        aligner.align()
+        self.assertAlmostEqual(aligner.score, expected)
+        self.assertAlmostEqual(aligner.matrix[-1, -1] / aligner.scale, expected)
+
+    def test_scale_limit(self):
+        """
+        Тест для дробного веса, который не становится целым после умножения на 10^4:
+        округлять его до 0 нельзя, должна быть ошибка
+        """
+        self.assertRaises(ValueError, Aligner, seq1='AAAA', seq2='AA', gap=-0.00004)
+
+        # 10^4 ещё хватает
+        aligner = Aligner(seq1='AAAA', seq2='AA', gap=-0.0004)
+        aligner.align()
+        self.assertAlmostEqual(aligner.score, 2 - 2 * 0.0004)
+
+    def test_score_only(self):
+        """
+        Тест для подсчёта только итогового веса по двум строкам
+        Вес должен совпасть с посчитанным по всей матрице
+        """
+        seq1, seq2 = 'GGTTGACTA', 'TGTTACGGTA'
+
+        for local in (False, True):
+            for weights in (False, 'pam', 'blosum'):
+                for gap in (-2, -0.5):
+                    aligner = Aligner(seq1=seq1, seq2=seq2, gap=gap, weights=weights, local=local)
+
+                    # без матрицы выравнивание получить нельзя
+                    aligner.align(need_traceback=False)
+                    self.assertIsNone(aligner.matrix)
+                    self.assertRaises(RuntimeError, aligner.select_global_alignment)
+                    score = aligner.score
+
+                    aligner.align()
+                    expected = aligner.matrix.max() if local else aligner.matrix[-1, -1]
+                    self.assertEqual(score, expected / aligner.scale)
+
     def test_with_weight(self):
         """
         Тест для не пустой матрицы веса
@@ -73,8 +165,9 @@ class TestAligner(unittest.TestCase):
         first_alignment = aligner.alignment
 
         # меняем веса в матрице сразу в двух местах, она же симметричная
-        aligner.weights.loc['B', 'D'] = -10
-        aligner.weights.loc['D', 'B'] = -10
+        b, d = aligner.alphabet[ord('B')], aligner.alphabet[ord('D')]
+        aligner.sub[b, d] = -10
+        aligner.sub[d, b] = -10
 
         # пересчитываем выравнивание
         aligner.align()
@@ -84,6 +177,60 @@ class TestAligner(unittest.TestCase):
         # хотим, чтобы были разные
         self.assertNotEqual(second_alignment, first_alignment)
 
+    def test_gap_symbol(self):
+        """
+        Тест для последовательности с символом '-': ход по вертикали берёт вес пропуска
+        для символа первой строки sub[a, '-'], ход по горизонтали - для символа второй sub['-', b]
+        """
+        aligner = Aligner(seq1='-', seq2='A', weights='pam')
+        aligner.align()
+
+        a, dash = aligner.alphabet[ord('A')], aligner.dash
+        up = aligner.matrix[0, 1] + aligner.sub[dash, dash] + aligner.gap
+        left = aligner.matrix[1, 0] + aligner.sub[dash, a] + aligner.gap
+        diag = aligner.matrix[0, 0] + aligner.sub[dash, a] + aligner.mismatch
+
+        # по PAM: ('-', '-') = 1, ('-', 'A') = -8, поэтому все три хода дают -8
+        self.assertEqual(aligner.matrix[1, 1], max(up, left, diag))
+        self.assertEqual(aligner.matrix[1, 1], -8)
+
+    def test_batch(self):
+        """
+        Тест для подсчёта весов сразу для многих пар
+        Веса должны совпасть с посчитанными по полной матрице для каждой пары
+        """
+        pairs = [('ABCA', 'BDAAAC'), ('GGTTGACTA', 'TGTTACGGTA'), ('A', 'ACGT'), ('', 'AC')]
+
+        for local in (False, True):
+            for weights in (False, 'pam'):
+                for gap in (-2, -0.5):
+                    scores = run_batch(pairs, gap=gap, weights=weights, local=local)
+
+                    for (seq1, seq2), score in zip(pairs, scores):
+                        aligner = Aligner(seq1=seq1, seq2=seq2, gap=gap, weights=weights, local=local)
+                        aligner.align()
+                        expected = aligner.matrix.max() if local else aligner.matrix[-1, -1]
+                        self.assertEqual(score, expected / aligner.scale)
+
+    def test_kernel_cache(self):
+        """
+        Тест для дискового кэша ядер: второй процесс не должен компилировать их заново
+        """
+        script = (
+            'from alignment.aligner import Aligner, run_batch, _FILL, _SCORE, _BATCH\n'
+            'aligner = Aligner("ABCA", "BDAAAC")\n'
+            'aligner.align()\n'
+            'aligner.align(need_traceback=False)\n'
+            'run_batch([("ABCA", "BDAAAC")])\n'
+            'kernels = (_FILL[(False, False)], _SCORE[(False, False)], _BATCH[(False, False)])\n'
+            'print(sum(len(kernel.stats.cache_misses) for kernel in kernels))\n'
+        )
+
+        # первый процесс может компилировать и записывать кэш, второй - только читать его
+        for _ in range(2):
+            misses = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+        self.assertEqual(misses.stdout.strip(), '0')
+
 
 if __name__ == '__main__':
     unittest.main()